@@ -1,21 +1,26 @@
 import sqlite3
-import uuid
-import time
 import io
 import os
 import pandas as pd
-from flask import Flask, request, jsonify
+import orjson
+import pyarrow as pa
+from pyarrow import ipc
+from decimal import Decimal
+from flask import Flask, Response, request, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import text
+from flask_compress import Compress
 import logging
+import zlib
+from functools import lru_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 try:
     from upload import Upload
-    from database import Database
-    from sql_assistant import SQLAssistApp
+    from database import Database, engine_for, release_memory_database
+    from sql_assistant import SQLAssistApp, run_coroutine
+    from session_store import InMemorySessionStore, create_session_store
     from langchain_community.utilities.sql_database import SQLDatabase
     logger.info("Successfully imported all modules")
 except ImportError as e:
@@ -24,25 +29,131 @@ except ImportError as e:
 
 app = Flask(__name__)
 
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "https://sql-assist.vercel.app",  
+]
+CORS_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+CORS_HEADERS = ["Content-Type", "Authorization", "X-Requested-With"]
+CORS_MAX_AGE = 86400
+
 CORS(app, 
-     origins=[
-         "http://localhost:3000",
-         "https://sql-assist.vercel.app",  
-     ],
-     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     supports_credentials=True
+     origins=CORS_ORIGINS,
+     methods=CORS_METHODS,
+     allow_headers=CORS_HEADERS,
+     supports_credentials=True,
+     max_age=CORS_MAX_AGE
 )
 
-sessions = {}  # { session_id: { "db": Database, "langchain_db": SQLDatabase, "last_used": ts } }
+def options_shortcut(wsgi_app):
+    """Answer CORS preflights from allowed origins before Flask routing and before_request hooks run."""
+    preflight_headers = [
+        ("Access-Control-Allow-Credentials", "true"),
+        ("Access-Control-Allow-Methods", ", ".join(CORS_METHODS)),
+        ("Access-Control-Allow-Headers", ", ".join(CORS_HEADERS)),
+        ("Access-Control-Max-Age", str(CORS_MAX_AGE)),
+        ("Vary", "Origin"),
+    ]
+
+    def wsgi(environ, start_response):
+        origin = environ.get("HTTP_ORIGIN")
+        if (environ["REQUEST_METHOD"] == "OPTIONS"
+                and "HTTP_ACCESS_CONTROL_REQUEST_METHOD" in environ
+                and origin in CORS_ORIGINS):
+            start_response("204 No Content", [("Access-Control-Allow-Origin", origin), *preflight_headers])
+            return [b""]
+        # Other origins fall through to flask-cors, which rejects them as before.
+        return wsgi_app(environ, start_response)
+
+    return wsgi
+
+app.wsgi_app = options_shortcut(app.wsgi_app)
 
 # --- Config ---
 ALLOWED_EXTENSIONS = {"sqlite", "db", "csv"}
 SESSION_TTL = 900  # 15 min
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+RUN_QUERY_CHUNK_SIZE = 10_000
+
+app.config["COMPRESS_ALGORITHM"] = ["zstd", "br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 2048
+app.config["COMPRESS_MIMETYPES"] = ["application/json", ARROW_STREAM_MIMETYPE]
+# Compressing a streamed run-query response would buffer it whole and undo the streaming.
+app.config["COMPRESS_STREAMS"] = False
+Compress(app)
+
+# Session metadata lives in Redis when REDIS_URL is set, so any worker can serve any session.
+sessions = create_session_store(SESSION_TTL)
+# Uploads are kept in this process's memory unless another worker may need to open them.
+IN_MEMORY_UPLOADS = isinstance(sessions, InMemorySessionStore)
+
+@lru_cache(maxsize=128)
+def session_resources(engine_url: str) -> dict:
+    """Process-local engine, LangChain database and assistant for a session's database."""
+    engine = engine_for(engine_url)
+    langchain_db = SQLDatabase(engine)
+    return {
+        "db": Database(engine),
+        "langchain_db": langchain_db,
+        "assistant": SQLAssistApp(langchain_db),
+    }
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def make_json_response(data: bytes, status: int = 200) -> Response:
+    return Response(data, status=status, mimetype="application/json")
+
+def jsonify_fast(data, status: int = 200) -> Response:
+    body = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=_orjson_default)
+    return make_json_response(body, status)
+
+def make_arrow_response(data: pd.DataFrame | pa.Table, metadata: dict) -> Response:
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata.update({key.encode(): str(value).encode() for key, value in metadata.items()})
+    table = table.replace_schema_metadata(schema_metadata)
+
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM_MIMETYPE)
+
+def wants_arrow() -> bool:
+    best = request.accept_mimetypes.best_match(["application/json", ARROW_STREAM_MIMETYPE])
+    return best == ARROW_STREAM_MIMETYPE
+
+def stream_rows(conn, result):
+    """Yield a {"columns": [...], "rows": [[...], ...]} JSON document one partition at a time."""
+    try:
+        yield b'{"columns":' + orjson.dumps(list(result.keys())) + b',"rows":['
+        first = True
+        for partition in result.partitions(RUN_QUERY_CHUNK_SIZE):
+            # Strip the enclosing brackets so partitions splice into one array.
+            chunk = orjson.dumps([tuple(row) for row in partition], default=_orjson_default)[1:-1]
+            yield chunk if first else b"," + chunk
+            first = False
+        yield b"]}"
+    except Exception as e:
+        logger.error(f"Row streaming error: {e}")
+        raise
+    finally:
+        conn.close()
+
+def gzip_stream(chunks):
+    """Compress a streamed body chunk by chunk, which Flask-Compress cannot do."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
 
 @app.route('/', methods=['GET'])
 def root():
-    return jsonify({
+    return jsonify_fast({
         "message": "SQL Assistant API",
         "version": "1.0.0",
         "server": "Flask + Gunicorn",
@@ -52,7 +163,7 @@ def root():
             "/api/run-query", 
             "/api/get-query"
         ]
-    }), 200
+    }, 200)
 
 @app.route("/api/upload", methods=["POST"])
 def upload_file():
@@ -60,36 +171,30 @@ def upload_file():
         logger.info("Processing file upload...")
         
         if "file" not in request.files:
-            return jsonify({"error": "No file"}), 400
+            return jsonify_fast({"error": "No file"}, 400)
 
         upload = Upload(request.files["file"])
         try:
-            engine = upload.to_engine() 
+            engine_url = upload.to_engine_url(in_memory=IN_MEMORY_UPLOADS)
         except ValueError as e:
-            return jsonify({"error": str(e)}), 400
+            return jsonify_fast({"error": str(e)}, 400)
 
-        db = Database(engine)
-        
         try:
-            langchain_db = SQLDatabase(engine)
+            session_resources(engine_url)
             logger.info("Created LangChain SQLDatabase successfully")
         except Exception as e:
-            logger.error(f"Failed to create LangChain SQLDatabase: {e}")
-            return jsonify({"error": f"Database initialization failed: {str(e)}"}), 500
+            logger.error(f"Failed to initialize session database: {e}")
+            release_memory_database(engine_url)
+            return jsonify_fast({"error": f"Database initialization failed: {str(e)}"}, 500)
 
-        session_id = str(uuid.uuid4())
-        sessions[session_id] = {
-            "db": db,
-            "langchain_db": langchain_db,
-            "last_used": time.time(),
-            }
+        session_id = sessions.create(engine_url)
 
         logger.info(f"File uploaded successfully, session: {session_id}")
-        return jsonify({"session_id": session_id})
+        return jsonify_fast({"session_id": session_id})
     
     except Exception as e:
         logger.error(f"Upload error: {e}")
-        return jsonify({"error": f"Upload failed: {str(e)}"}), 500
+        return jsonify_fast({"error": f"Upload failed: {str(e)}"}, 500)
 
 @app.route("/api/run-query", methods=["POST"])
 def run_query():
@@ -97,43 +202,50 @@ def run_query():
         payload = request.get_json()
         
         if not payload:
-            return jsonify({"error": "No JSON payload"}), 400
+            return jsonify_fast({"error": "No JSON payload"}, 400)
             
         session_id = payload.get("session_id")
         sql = payload.get("sql")
 
-        if not session_id or session_id not in sessions:
-            return jsonify({"error": "Invalid session"}), 400
+        session = sessions.get(session_id)
+        if session is None:
+            return jsonify_fast({"error": "Invalid session"}, 400)
 
         if not sql:
-            return jsonify({"error": "SQL query required"}), 400
+            return jsonify_fast({"error": "SQL query required"}, 400)
 
-        db = sessions[session_id]["db"]
-        sessions[session_id]["last_used"] = time.time()
+        db = session_resources(session["engine_url"])["db"]
 
         try:
-            with db.engine.connect() as conn:
-                result = conn.execute(text(sql))
-                
-                if result.returns_rows:
-                    rows = result.fetchall()
-                    columns = list(result.keys()) if rows else []
-                    return jsonify({
-                        "columns": columns, 
-                        "rows": [dict(zip(columns, row)) for row in rows]
-                    })
-                else:
-                    return jsonify({
-                        "message": "Query executed successfully", 
-                        "rows_affected": result.rowcount
-                    })
+            conn = db.engine.connect().execution_options(yield_per=RUN_QUERY_CHUNK_SIZE)
+            try:
+                result = conn.exec_driver_sql(sql)
+            except Exception:
+                conn.close()
+                raise
+
+            if result.returns_rows:
+                # The connection is closed by stream_rows once the last partition is sent.
+                body = stream_rows(conn, result)
+                headers = {}
+                if request.accept_encodings["gzip"]:
+                    body = gzip_stream(body)
+                    headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+                return Response(stream_with_context(body), mimetype="application/json", headers=headers)
+
+            rows_affected = result.rowcount
+            conn.close()
+            return jsonify_fast({
+                "message": "Query executed successfully", 
+                "rows_affected": rows_affected
+            })
         except Exception as e:
             logger.error(f"Query execution error: {e}")
-            return jsonify({"error": str(e)}), 400
+            return jsonify_fast({"error": str(e)}, 400)
     
     except Exception as e:
         logger.error(f"Run query error: {e}")
-        return jsonify({"error": f"Request failed: {str(e)}"}), 500
+        return jsonify_fast({"error": f"Request failed: {str(e)}"}, 500)
     
 @app.route('/api/get-query', methods=['POST'])
 def process_query():
@@ -143,42 +255,56 @@ def process_query():
         payload = request.get_json()
         
         if not payload:
-            return jsonify({"error": "No JSON payload"}), 400
+            return jsonify_fast({"error": "No JSON payload"}, 400)
             
         session_id = payload.get("session_id")
         user_question = payload.get('question', '')
         
         logger.info(f"Session: {session_id}, Question: {user_question[:100]}...")
         
-        if not session_id or session_id not in sessions:
-            return jsonify({
+        session = sessions.get(session_id)
+        if session is None:
+            return jsonify_fast({
                 'success': False,
                 'error': 'Invalid session. Please upload a file first.'
-            }), 400
+            }, 400)
         
         if len(user_question) < 10:
-            return jsonify({
+            return jsonify_fast({
                 'success': False,
                 'error': 'Question too short. Please ask a clearer question.'
-            }), 400
-        
-        langchain_db = sessions[session_id]["langchain_db"]
-        sessions[session_id]["last_used"] = time.time()
+            }, 400)
         
         try:
-            sql_assistant = SQLAssistApp(langchain_db)  
-            
-            logger.info("Executing query_structured...")
-            result = sql_assistant.query_structured(user_question)
-            
+            sql_assistant = session_resources(session["engine_url"])["assistant"]
+            logger.info("Executing aquery_structured...")
+            as_arrow = wants_arrow()
+            result = run_coroutine(sql_assistant.aquery_structured(user_question, as_arrow=as_arrow))
+
+            if as_arrow and result.get('result') is not None:
+                try:
+                    # Answer fields travel as schema metadata; the rows are the record batches.
+                    response = make_arrow_response(result['result'], {
+                        "question": result.get("question"),
+                        "sql_query": result.get("sql_query") or "",
+                        "answer": result.get("answer"),
+                        "row_count": result.get("row_count"),
+                    })
+                    logger.info(f"Query processed successfully. Streaming {result.get('row_count')} results as Arrow")
+                    return response
+                except pa.ArrowException as e:
+                    logger.warning(f"Arrow serialization failed, falling back to JSON: {e}")
+                if isinstance(result['result'], pa.Table):
+                    result['result'] = result['result'].to_pandas()
 
             if result.get('result') is not None and not result['result'].empty:
-                results_data = result['result'].to_dict('records')
+                # pandas encodes the records in C; orjson embeds that text as-is, so no per-row dicts are built.
+                results_data = orjson.Fragment(result['result'].to_json(orient='records', date_format='iso'))
             else:
                 results_data = []
             
-            logger.info(f"Query processed successfully. Found {len(results_data)} results")
-            return jsonify({
+            logger.info(f"Query processed successfully. Found {result.get('row_count')} results")
+            return jsonify_fast({
                 "success": True,
                 "result": {
                     "question": result.get("question"),
@@ -190,17 +316,17 @@ def process_query():
             
         except Exception as e:
             logger.error(f"SQLAssistApp error: {e}")
-            return jsonify({
+            return jsonify_fast({
                 'success': False, 
                 'error': f"Failed to process question: {str(e)}"
-            }), 500
+            }, 500)
     
     except Exception as e:
         logger.error(f"Process query error: {e}")
-        return jsonify({
+        return jsonify_fast({
             'success': False, 
             'error': f"Request failed: {str(e)}"
-        }), 500
+        }, 500)
     
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -215,7 +341,7 @@ def health_check():
             test_passed = False
             error_msg = f"LangChain import failed: {e}"
             
-        return jsonify({
+        return jsonify_fast({
             'status': 'healthy' if test_passed else 'degraded',
             'message': 'SQL Assistant API is running',
             'modules_loaded': test_passed,
@@ -223,38 +349,30 @@ def health_check():
             'sessions_active': len(sessions)
         })
     except Exception as e:
-        return jsonify({
+        return jsonify_fast({
             'status': 'error',
             'message': str(e)
-        }), 500
+        }, 500)
 
 @app.before_request
 def cleanup_sessions():
     try:
-        now = time.time()
-        expired = [sid for sid, data in sessions.items() if now - data["last_used"] > SESSION_TTL]
-        
-        for sid in expired:
-            try:
-                sessions[sid]["db"].engine.dispose()
-                if hasattr(sessions[sid]["langchain_db"], '_engine'):
-                    sessions[sid]["langchain_db"]._engine.dispose()
-                logger.info(f"Cleaned up expired session: {sid}")
-            except Exception as e:
-                logger.error(f"Error cleaning up session {sid}: {e}")
-            finally:
-                sessions.pop(sid, None)
+        # Engines stay in the process-local session_resources cache until evicted,
+        # but an in-memory upload's data is freed as soon as its session expires.
+        for sid, session in sessions.cleanup():
+            release_memory_database(session["engine_url"])
+            logger.info(f"Cleaned up expired session: {sid}")
     except Exception as e:
         logger.error(f"Session cleanup error: {e}")
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({"error": "Endpoint not found"}), 404
+    return jsonify_fast({"error": "Endpoint not found"}, 404)
 
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Internal server error: {error}")
-    return jsonify({"error": "Internal server error"}), 500
+    return jsonify_fast({"error": "Internal server error"}, 500)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,6 @@
+from asgiref.wsgi import WsgiToAsgi
+from api import app
+
+# ASGI entry point for uvicorn, e.g. `uvicorn asgi:asgi_app --loop uvloop --http httptools`.
+# Flask views still run in asgiref's thread pool; the event loop handles the socket I/O.
+asgi_app = WsgiToAsgi(app)
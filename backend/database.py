@@ -1,9 +1,70 @@
 from pathlib import Path
+from functools import lru_cache
+import sqlite3
+import threading
+import uuid
 import requests
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, StaticPool
 from langchain_community.utilities.sql_database import SQLDatabase
 
+MEMORY_URL_PREFIX = "memory:"
+
+# In-memory upload databases by URL. Each lives in a single connection, so it disappears once released.
+_memory_databases: dict[str, sqlite3.Connection] = {}
+_memory_lock = threading.Lock()
+
+def register_memory_database(conn: sqlite3.Connection) -> str:
+    """Keep an in-memory database connection for this process and return the URL that selects it."""
+    url = f"{MEMORY_URL_PREFIX}{uuid.uuid4()}"
+    with _memory_lock:
+        _memory_databases[url] = conn
+    return url
+
+def release_memory_database(url: str) -> None:
+    with _memory_lock:
+        conn = _memory_databases.pop(url, None)
+    if conn is not None:
+        conn.close()
+
+SQLITE_PRAGMAS = (
+    # Uploads are scratch copies that are only read, so durability can go.
+    "PRAGMA journal_mode=MEMORY",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+def _tune_sqlite(dbapi_conn, connection_record) -> None:
+    cursor = dbapi_conn.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+@lru_cache(maxsize=128)
+def engine_for(url: str) -> Engine:
+    """One pooled engine per database URL, shared by every session that points at it."""
+    if url.startswith(MEMORY_URL_PREFIX):
+        with _memory_lock:
+            conn = _memory_databases.get(url)
+        if conn is None:
+            raise ValueError("In-memory database is no longer available")
+        # Every checkout must hand out the one connection that holds the data.
+        engine = create_engine("sqlite://", creator=lambda: conn, poolclass=StaticPool)
+    else:
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            poolclass=QueuePool,
+            pool_size=5,
+            pool_pre_ping=False,
+        )
+    event.listen(engine, "connect", _tune_sqlite)
+    return engine
+
 class Database:
     def __init__(self, engine):
         self.engine = engine
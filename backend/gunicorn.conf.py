@@ -0,0 +1,17 @@
+import os
+
+# Import the app once in the master; workers then share the loaded modules copy-on-write.
+preload_app = True
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+# In-process sessions are per worker, so only run several workers when sessions live in Redis.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 if os.environ.get("REDIS_URL") else 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def when_ready(server):
+    # Runs in the master after preload_app has imported the app and before any worker forks,
+    # so the model libraries sql_assistant loads lazily are shared with the workers as well.
+    from sql_assistant import preload
+    preload()
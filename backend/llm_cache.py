@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from typing import Any
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "sql_assist_llm_cache.sqlite3")
+MAX_ENTRIES = 10_000
+
+
+def cache_key(model_name: str, prompt: str, schema: str = "") -> str:
+    payload = json.dumps({"m": model_name, "p": prompt, "s": schema}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """Exact-match cache of LLM responses, kept in a SQLite file shared by every worker on the host.
+
+    Entries are JSON values evicted least-recently-used once there are more than max_entries.
+    Cache errors are logged and treated as misses so they never fail a query.
+    """
+    def __init__(self, path: str | None = None, max_entries: int = MAX_ENTRIES) -> None:
+        self.path = path or os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        except sqlite3.Error as e:
+            print(f"Error initializing LLM cache at {self.path}: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Any | None:
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Error reading LLM cache: {e}")
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, last_used) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time()),
+                )
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing LLM cache: {e}")
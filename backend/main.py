@@ -1,25 +1,53 @@
-from database import Database
+from pathlib import Path
+from database import Database, engine_for
 from sql_assistant import SQLAssistApp
 from utils import display_results, chinook_test_questions, sakila_test_questions, general_test_questions
 
+def choose_database(data_dir: str = "data") -> Path:
+    """Pick one of the SQLite files in data_dir, asking when there is more than one."""
+    data_path = Path(data_dir)
+    data_path.mkdir(parents=True, exist_ok=True)
+
+    db_files = list(data_path.glob("*.sqlite")) + list(data_path.glob("*.db"))
+
+    if not db_files:
+        raise FileNotFoundError(f"No database files found in {data_path}")
+
+    # If only one DB, pick automatically
+    if len(db_files) == 1:
+        print(f"Using database: {db_files[0]}")
+        return db_files[0]
+
+    print("Available databases:")
+    for i, db_file in enumerate(db_files, 1):
+        print(f"{i}. {db_file.name}")
+
+    while True:
+        choice = input(f"Select a database [1-{len(db_files)}]: ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(db_files):
+            db_path = db_files[int(choice) - 1]
+            print(f"Using database: {db_path}")
+            return db_path
+        print("Invalid choice. Try again.")
+
 def main() -> None:
-    db = Database()
+    db_path = choose_database()
+    db = Database(engine_for(f"sqlite:///{db_path}"))
     sql_database = db.create_sql_database()
     
     app = SQLAssistApp(sql_database)
     print("===== Natural Language to SQL Assistant =====")
-    name_db = db.db_path.name.lower()
+    name_db = db_path.name.lower()
     print(f"Ask questions about the '{name_db}' database!")
     user_prompt = input("Type 'test' to see example queries or Enter your question: ")
     if user_prompt.lower() == 'test':
-        if db.db_path and "chinook" in name_db:
+        if "chinook" in name_db:
             test_questions = chinook_test_questions
-        elif db.db_path and "sakila" in name_db:
+        elif "sakila" in name_db:
             test_questions = sakila_test_questions
         else:
             test_questions = general_test_questions
-        for q in test_questions:
-            result = app.query_structured(q)
+        for result in app.query_structured_batch(test_questions):
             display_results(result)
     elif len(user_prompt) < 10:
         print(f"**The SQL query could not be validated for your question. Please ask a clearer question.**\n")
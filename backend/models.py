@@ -1,13 +1,25 @@
-from typing_extensions import TypedDict
+from typing_extensions import Annotated, TypedDict
 import pandas as pd
+import pyarrow as pa
 
 class QueryOutput(TypedDict):
-    """Generated SQL query."""
-    query: str
+    """Generated SQL query with a self-check of how well it answers the question."""
+    query: Annotated[str, ..., "Syntactically valid SQL query."]
+    confidence: Annotated[float, ..., "Confidence between 0 and 1 that the query answers the question."]
+    rationale: Annotated[str, ..., "One sentence on why the query does or does not answer the question."]
+
+class BatchQueryItem(QueryOutput):
+    """Generated SQL query for one question of a numbered batch."""
+    index: Annotated[int, ..., "Number of the question this query answers."]
+
+class BatchQueryOutput(TypedDict):
+    """Generated SQL queries for a numbered list of questions."""
+    queries: Annotated[list[BatchQueryItem], ..., "One entry per question."]
     
 class State(TypedDict):
     question: str
     query: str | None
+    confidence: float | None
     result: str | None
     answer: str | None
     row_count: int | None
@@ -15,6 +27,6 @@ class State(TypedDict):
 class QueryResult(TypedDict):
     question: str
     sql_query: str
-    result: pd.DataFrame
+    result: pd.DataFrame | pa.Table
     answer: str
     row_count: int
\ No newline at end of file
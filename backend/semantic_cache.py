@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "sql_assist_semantic_cache.sqlite3")
+MAX_ENTRIES_PER_SCHEMA = 1000
+
+# Similarity above which a cached answer is reused as-is, and above which it is reused
+# only after the LLM confirms the cached SQL also answers the new question.
+REUSE_THRESHOLD = 0.92
+VERIFY_THRESHOLD = 0.80
+
+
+def schema_hash(table_info: str) -> str:
+    return hashlib.sha256(table_info.encode()).hexdigest()
+
+
+class SemanticCache:
+    """Finds previously answered questions that mean the same thing as a new one.
+
+    Entries hold the question's normalized embedding plus the SQL and answer produced for it,
+    are persisted to a SQLite file, and are only compared within the same schema hash so
+    answers never leak between uploaded databases.
+    """
+    def __init__(self, embeddings, path: str | None = None, dimensions: int = 768) -> None:
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+        self.path = path or os.environ.get("SEMANTIC_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self._lock = threading.Lock()
+        # { schema_hash: (embedding matrix, [{"sql_query": ..., "answer": ...}, ...]) }, loaded lazily
+        self._entries: dict[str, tuple[np.ndarray, list[dict]]] = {}
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS semantic_cache "
+                    "(schema_hash TEXT NOT NULL, question TEXT NOT NULL, embedding BLOB NOT NULL, "
+                    "sql_query TEXT NOT NULL, answer TEXT NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS semantic_cache_schema ON semantic_cache (schema_hash)")
+        except sqlite3.Error as e:
+            print(f"Error initializing semantic cache at {self.path}: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def embed(self, question: str) -> np.ndarray:
+        """Embed a question as a unit vector, so a dot product is its cosine similarity."""
+        vector = np.asarray(
+            self.embeddings.embed_query(question, output_dimensionality=self.dimensions),
+            dtype=np.float32,
+        )
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _load(self, schema: str) -> tuple[np.ndarray, list[dict]]:
+        if schema not in self._entries:
+            try:
+                with closing(self._connect()) as conn:
+                    rows = conn.execute(
+                        "SELECT embedding, sql_query, answer FROM semantic_cache WHERE schema_hash = ?",
+                        (schema,),
+                    ).fetchall()
+            except sqlite3.Error as e:
+                print(f"Error reading semantic cache: {e}")
+                rows = []
+            matrix = np.array([np.frombuffer(row[0], dtype=np.float32) for row in rows], dtype=np.float32)
+            entries = [{"sql_query": row[1], "answer": row[2]} for row in rows]
+            self._entries[schema] = (matrix.reshape(len(rows), self.dimensions), entries)
+        return self._entries[schema]
+
+    def lookup(self, schema: str, vector: np.ndarray) -> tuple[float, dict] | None:
+        """Return (similarity, entry) for the closest cached question, or None if there is none."""
+        with self._lock:
+            matrix, entries = self._load(schema)
+            if not entries:
+                return None
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            return float(similarities[best]), entries[best]
+
+    def add(self, schema: str, question: str, vector: np.ndarray, sql_query: str, answer: str) -> None:
+        with self._lock:
+            matrix, entries = self._load(schema)
+            if len(entries) >= MAX_ENTRIES_PER_SCHEMA:
+                return
+            try:
+                with closing(self._connect()) as conn, conn:
+                    conn.execute(
+                        "INSERT INTO semantic_cache (schema_hash, question, embedding, sql_query, answer) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (schema, question, vector.astype(np.float32).tobytes(), sql_query, answer),
+                    )
+            except sqlite3.Error as e:
+                print(f"Error writing semantic cache: {e}")
+                return
+            self._entries[schema] = (np.vstack([matrix, vector]), entries + [{"sql_query": sql_query, "answer": answer}])
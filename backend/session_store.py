@@ -0,0 +1,106 @@
+import heapq
+import os
+import threading
+import time
+import uuid
+
+
+class InMemorySessionStore:
+    """Keeps session metadata in this process. Only valid with a single worker.
+
+    Request threads share the store, so every read and write holds the lock.
+    """
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._sessions: dict[str, dict] = {}  # { session_id: { "engine_url": str, "last_used": ts } }
+        # (expires_at, session_id), pushed on every touch; entries made stale by a later touch are skipped lazily.
+        self._expiry_heap: list[tuple[float, str]] = []
+
+    def _touch(self, session_id: str, session: dict) -> None:
+        now = time.time()
+        session["last_used"] = now
+        heapq.heappush(self._expiry_heap, (now + self.ttl, session_id))
+
+    def create(self, engine_url: str) -> str:
+        session_id = str(uuid.uuid4())
+        session = {"engine_url": engine_url}
+        with self._lock:
+            self._sessions[session_id] = session
+            self._touch(session_id, session)
+        return session_id
+
+    def get(self, session_id: str | None) -> dict | None:
+        """Return the session and mark it as used, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id, session)
+            return session
+
+    def cleanup(self) -> list[tuple[str, dict]]:
+        """Drop idle sessions and return them with their ids. Only looks at heap entries that are due."""
+        expired = []
+        with self._lock:
+            now = time.time()
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, sid = heapq.heappop(self._expiry_heap)
+                session = self._sessions.get(sid)
+                # Same arithmetic as the heap key, so a due entry for an untouched session always expires it.
+                if session is not None and session["last_used"] + self.ttl <= now:
+                    del self._sessions[sid]
+                    expired.append((sid, session))
+        return expired
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+class RedisSessionStore:
+    """Keeps session metadata in Redis so every worker sees every session.
+
+    Idle sessions are expired by Redis itself: the key TTL is refreshed on each access.
+    """
+    KEY_PREFIX = "sess:"
+
+    def __init__(self, url: str, ttl: int) -> None:
+        import msgpack
+        import redis
+
+        self.ttl = ttl
+        self._msgpack = msgpack
+        self._redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(url))
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    def create(self, engine_url: str) -> str:
+        session_id = str(uuid.uuid4())
+        packed = self._msgpack.packb({"engine_url": engine_url})
+        self._redis.set(self._key(session_id), packed, ex=self.ttl)
+        return session_id
+
+    def get(self, session_id: str | None) -> dict | None:
+        """Return the session and refresh its TTL, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        packed = self._redis.getex(self._key(session_id), ex=self.ttl)
+        if packed is None:
+            return None
+        return self._msgpack.unpackb(packed)
+
+    def cleanup(self) -> list[tuple[str, dict]]:
+        return []
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._redis.scan_iter(match=f"{self.KEY_PREFIX}*", count=1000))
+
+
+def create_session_store(ttl: int) -> InMemorySessionStore | RedisSessionStore:
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        return RedisSessionStore(redis_url, ttl)
+    return InMemorySessionStore(ttl)
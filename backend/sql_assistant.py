@@ -1,26 +1,209 @@
 import os
+import re
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
-from langchain_community.utilities.sql_database import SQLDatabase
+from sqlalchemy.exc import SQLAlchemyError
 import pandas as pd
-import ast
-from typing import Dict
-from models import QueryOutput, State, QueryResult
+import pyarrow as pa
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict
+from models import QueryOutput, BatchQueryOutput, State, QueryResult
+from llm_cache import LLMCache, cache_key
+from semantic_cache import SemanticCache, REUSE_THRESHOLD, VERIFY_THRESHOLD, schema_hash
+
+# The LangChain, Gemini and sqlglot imports take over a second, so they are deferred to first use
+# (or to preload()) instead of being paid by every process that imports this module.
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_community.utilities.sql_database import SQLDatabase
+
+# Read once per process; LangSmith picks its own settings up from the environment.
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# Queries the model itself scores below this are rejected without running them.
+MIN_QUERY_CONFIDENCE = 0.5
+# Queries scored between the two that pass the local SQL checks are confirmed with the LLM.
+CONFIDENT_QUERY = 0.8
+# Results up to this many rows go into the answer prompt in full; longer ones as a sample plus summary.
+PROMPT_SAMPLE_ROWS = 20
+
+# Everything up to the schema is identical for every question and every upload, and the
+# question comes last, so Gemini's implicit prefix caching can skip re-reading the shared part.
+QUERY_SYSTEM_MESSAGE = """You are a SQL assistant. Generate a syntactically correct {dialect} query to answer the user's question.
+             Unless the user specifies in his question a specific number of examples they wish to obtain, 
+             always limit your query to at most {top_k} results. You can order the results by a relevant column to
+             return the most interesting examples in the database.
+             Never query for all the columns from a specific table, only ask for a the few relevant columns given the question.
+             Pay attention to use only the column names that you can see in the schema
+             description. Be careful to not query for columns that do not exist. Also,
+             pay attention to which column is in which table.
+             
+             If the user asks for "first 5 rows" or similar, use the FIRST table name from the schema below.
+             Do NOT use placeholder names like 'your_table' - use the actual table names provided.
+             
+             Finally, check your own query: set confidence between 0 and 1 for how well it answers the question,
+             and give a one sentence rationale. Use a confidence below 0.5 if the question is unclear, meaningless,
+             or cannot be answered from these tables.
+             
+             IMPORTANT: Only use the following tables and their exact names: {table_info}"""
+
+EQUIVALENCE_INSTRUCTIONS = (
+    "You are an SQL validation assistant. Does the SQL query below correctly answer the question? "
+    "Answer only 'yes' or 'no'."
+)
+
+# gRPC keeps one HTTP/2 channel per client and multiplexes concurrent calls over it. The async
+# client (grpc_asyncio) is created lazily on the shared event loop below.
+GEMINI_TRANSPORT = "grpc"
+
+@lru_cache(maxsize=1)
+def _query_prompt_template():
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_messages([
+        ("system", QUERY_SYSTEM_MESSAGE),
+        ("human", "{user_prompt}")
+    ])
+
+@lru_cache(maxsize=4)
+def _make_llm(model_name: str, api_key: str, temperature: float) -> "ChatGoogleGenerativeAI":
+    """Shared Gemini client, so every assistant reuses one connection pool."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=api_key,
+        temperature=temperature,
+        transport=GEMINI_TRANSPORT
+    )
+
+@lru_cache(maxsize=4)
+def _make_semantic_cache(api_key: str) -> SemanticCache:
+    """Shared by every assistant so each schema's embeddings are loaded once per process."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    embeddings = GoogleGenerativeAIEmbeddings(
+        model="models/gemini-embedding-001",
+        google_api_key=api_key,
+        task_type="SEMANTIC_SIMILARITY",
+        transport=GEMINI_TRANSPORT
+    )
+    return SemanticCache(embeddings)
+
+# Above this many tables, the query prompt keeps sample rows only for tables related to the question.
+SCHEMA_FILTER_MIN_TABLES = 8
+_SAMPLE_ROWS_RE = re.compile(r"\n*/\*\n\d+ rows from .*?\*/", re.DOTALL)
+
+# Questions that only ask for data; small results for them are shown without an LLM write-up.
+DIRECT_ANSWER_MAX_ROWS = 20
+_DATA_QUESTION_RE = re.compile(
+    r"^\s*(?:how many|count|list|show|display|give me|get|(?:the )?(?:top|first|last) \d+)\b", re.IGNORECASE
+)
+
+def _direct_answer(state: State) -> str | None:
+    """One-line answer for a data question with a small result, or None if it needs the LLM."""
+    result = state["result"]
+    if not _DATA_QUESTION_RE.match(state["question"] or "") or len(result) > DIRECT_ANSWER_MAX_ROWS:
+        return None
+    if len(result) == 1 and len(result.columns) == 1:
+        value = result.column(0)[0].as_py() if isinstance(result, pa.Table) else result.iat[0, 0]
+        column = result.column_names[0] if isinstance(result, pa.Table) else result.columns[0]
+        return f"**{column}**: **{value}**"
+    return f"Found **{len(result)}** {'row' if len(result) == 1 else 'rows'}; see the results table."
+
+def _singular(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+def _identifier_words(identifier: str) -> set[str]:
+    # "InvoiceLine" -> {"invoice", "line"}, "customer_id" -> {"customer"}; very short parts match too much.
+    parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+", identifier)
+    return {_singular(part.lower()) for part in parts if len(part) > 2}
+
+# First table name in the schema, quoted ("x", `x`, [x]) or bare.
+_CREATE_TABLE_RE = re.compile(
+    r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|([^\s(]+))',
+    re.IGNORECASE,
+)
+
+def preload() -> None:
+    """Import the lazily loaded dependencies now, e.g. in a server process before it forks workers."""
+    import langchain_google_genai
+    import langchain_community.utilities.sql_database
+    import sqlglot
+
+    _query_prompt_template()
+
+# Runs SQL for the async and batch paths, shared by every assistant in the process.
+_SQL_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sql-query")
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_pid: int | None = None
+_loop_lock = threading.Lock()
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    # The Gemini async client binds to the loop it first runs on, so all coroutines in a
+    # process share one long-lived loop. It is started lazily, and again after a fork.
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="sql-assist-loop", daemon=True).start()
+        return _loop
+
+def run_coroutine(coro):
+    """Run a coroutine on this process's shared event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+
+def _unique_columns(columns: list[str]) -> list[str]:
+    # Joins often repeat a column name (e.g. two "Name" columns); records output needs unique keys.
+    seen: Dict[str, int] = {}
+    unique = []
+    for column in columns:
+        count = seen.get(column, 0)
+        seen[column] = count + 1
+        unique.append(column if count == 0 else f"{column}_{count}")
+    return unique
+
+def _rows_to_table(rows, columns: list[str]) -> pa.Table:
+    # Build columns straight from the row tuples; no DataFrame or per-row dicts in between.
+    if rows:
+        arrays = [pa.array(values) for values in zip(*rows)]
+    else:
+        arrays = [pa.array([]) for _ in columns]
+    return pa.Table.from_arrays(arrays, names=columns)
+
+def _result_for_prompt(result) -> str:
+    """Describe a query result for the answer prompt without pasting every row into it."""
+    if isinstance(result, pa.Table):
+        sample = result.slice(0, PROMPT_SAMPLE_ROWS).to_pandas()
+        numeric = result.select([
+            field.name for field in result.schema if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        ]).to_pandas()
+    else:
+        sample = result.head(PROMPT_SAMPLE_ROWS)
+        numeric = result.select_dtypes("number")
+    if len(result) <= PROMPT_SAMPLE_ROWS:
+        return sample.to_csv(index=False)
+    summary = f"{len(result)} rows, {len(sample.columns)} columns. First {PROMPT_SAMPLE_ROWS} rows:\n{sample.to_csv(index=False)}"
+    if len(numeric.columns):
+        summary += f"\nSummary of numeric columns over all rows:\n{numeric.describe().to_string()}"
+    return summary
 
 class SQLAssistApp:
     def __init__(
         self,
-        database: SQLDatabase,
+        database: "SQLDatabase",
         model_name: str = "gemini-2.0-flash-lite",
         model_provider="google_genai",
         top_k: int = 5,
         dialect: str = "SQLite",    
+        google_api_key: str | None = None,
     ) -> None:
-        load_dotenv()
-        os.environ["LANGSMITH_API_KEY"] = os.getenv("LANGSMITH_API_KEY")
-        google_api_key = os.getenv("GOOGLE_API_KEY")
+        google_api_key = google_api_key or GOOGLE_API_KEY
         
         if not google_api_key:
             raise ValueError("GOOGLE_API_KEY environment variable is required")
@@ -28,102 +211,196 @@ class SQLAssistApp:
         self.dialect = dialect
         self.top_k = top_k
         self.database = database
-        self.llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            google_api_key=google_api_key,
-            temperature=0.1
-        )
+        self._table_info: str | None = None
+        self.model_name = model_name
+        self.llm = _make_llm(model_name, google_api_key, 0.1)
+        self._structured_llm = self.llm.with_structured_output(QueryOutput)
+        self._batch_structured_llm = self.llm.with_structured_output(BatchQueryOutput)
+        self.llm_cache = LLMCache()
+        self.semantic_cache = _make_semantic_cache(google_api_key)
+        self._schema_hash: str | None = None
+        self._table_infos: Dict[str, str] | None = None
     
-    def write_query(self, state: State) -> Dict[str, str]:
+    def _get_table_info(self) -> str:
+        # The uploaded schema does not change for the lifetime of a session,
+        # so reflect it once instead of on every question.
+        if self._table_info is None:
+            self._table_info = self.database.get_table_info()
+        return self._table_info
+
+    def invalidate_schema(self) -> None:
+        """Forget the cached schema and re-reflect the database, e.g. after its tables change."""
+        from langchain_community.utilities.sql_database import SQLDatabase
+
+        # SQLDatabase reflects its tables once on construction, so rebuild it as well.
+        self.database = SQLDatabase(self.database._engine)
+        self._table_info = None
+        self._schema_hash = None
+        self._table_infos = None
+
+    def _get_schema_hash(self) -> str:
+        if self._schema_hash is None:
+            self._schema_hash = schema_hash(self._get_table_info())
+        return self._schema_hash
+
+    def _table_info_for(self, question: str) -> str:
+        """Schema for the query prompt: sample rows only for the tables the question seems to be about.
+
+        Small schemas, and questions that match no table, get the full table info.
+        """
+        tables = {table.name: table for table in self.database._metadata.sorted_tables}
+        if len(tables) <= SCHEMA_FILTER_MIN_TABLES:
+            return self._get_table_info()
+        words = {_singular(word) for word in re.findall(r"[a-z0-9]+", question.lower())}
+        relevant = {
+            name for name, table in tables.items()
+            if _identifier_words(name) & words
+            or any(_identifier_words(column.name) & words for column in table.columns)
+        }
+        if not relevant:
+            return self._get_table_info()
+        # Joins usually need the tables one foreign key away as well.
+        neighbours = set()
+        for name, table in tables.items():
+            referenced = {fk.column.table.name for fk in table.foreign_keys}
+            if name in relevant:
+                neighbours |= referenced
+            elif referenced & relevant:
+                neighbours.add(name)
+        relevant |= neighbours
+        if self._table_infos is None:
+            self._table_infos = {name: self.database.get_table_info([name]) for name in tables}
+        return "\n\n".join(
+            info if name in relevant else _SAMPLE_ROWS_RE.sub("", info)
+            for name, info in sorted(self._table_infos.items())
+        )
+
+    def _query_prompt(self, state: State):
+        return self._prompt_for_question(state["question"] or "")
+
+    def _prompt_for_question(self, question: str):
+        table_info = self._table_info_for(question)
+        print(f"Available tables: {table_info}")
+        
+        return _query_prompt_template().invoke({
+            "dialect": self.dialect,
+            "top_k": self.top_k,
+            "table_info": table_info,
+            "user_prompt": question,
+        })
+
+    def _parse_query_output(self, result) -> Dict[str, Any]:
+        generated_query = result.query if hasattr(result, 'query') else result["query"]
+        confidence = result.confidence if hasattr(result, 'confidence') else result.get("confidence")
+        confidence = float(confidence) if confidence is not None else None
+        rationale = result.rationale if hasattr(result, 'rationale') else result.get("rationale")
+        print(f"Generated query: {generated_query} (confidence: {confidence}, rationale: {rationale})")
+        
+        return {"query": generated_query, "confidence": confidence}
+
+    def _fallback_query(self) -> Dict[str, Any]:
         try:
-            # Get actual table information
-            table_info = self.database.get_table_info()
-            print(f"Available tables: {table_info}")
-            
-            system_message = """You are a SQL assistant. Generate a syntactically correct {dialect} query to answer the user's question.
-                 Unless the user specifies in his question a specific number of examples they wish to obtain, 
-                 always limit your query to at most {top_k} results. You can order the results by a relevant column to
-                 return the most interesting examples in the database.
-                 Never query for all the columns from a specific table, only ask for a the few relevant columns given the question.
-                 Pay attention to use only the column names that you can see in the schema
-                 description. Be careful to not query for columns that do not exist. Also,
-                 pay attention to which column is in which table.
-                 
-                 IMPORTANT: Only use the following tables and their exact names: {table_info}
-                 
-                 If the user asks for "first 5 rows" or similar, use the FIRST table name from the schema above.
-                 Do NOT use placeholder names like 'your_table' - use the actual table names provided."""
-                 
-            query_prompt_template = ChatPromptTemplate.from_messages([
-                ("system", system_message),
-                ("human", "{user_prompt}")
-            ])
-            
-            prompt = query_prompt_template.invoke({
-                "dialect": self.dialect,
-                "top_k": self.top_k,
-                "table_info": table_info,
-                "user_prompt": state["question"] or "",
-            })
-            
-            structured_llm = self.llm.with_structured_output(QueryOutput)
-            result = structured_llm.invoke(prompt)
-            
-            generated_query = result.query if hasattr(result, 'query') else result["query"]
-            print(f"Generated query: {generated_query}")
-            
-            return {"query": generated_query}
+            table_info = self._get_table_info()
+
+            match = _CREATE_TABLE_RE.search(table_info)
+            first_table = next(name for name in match.groups() if name) if match else None
             
+            if first_table:
+                fallback_query = f'SELECT * FROM "{first_table}" LIMIT 5;'
+            else:
+                fallback_query = "SELECT name FROM sqlite_master WHERE type='table';"
+                
+            print(f"Using fallback query: {fallback_query}")
+            return {"query": fallback_query, "confidence": None}
+        except:
+            return {"query": "SELECT name FROM sqlite_master WHERE type='table';", "confidence": None}
+
+    def write_query(self, state: State, cache: bool = True) -> Dict[str, Any]:
+        try:
+            prompt = self._query_prompt(state)
+            key = cache_key(self.model_name, prompt.to_string(), self._get_table_info())
+            output = self.llm_cache.get(key) if cache else None
+            if output is None:
+                output = dict(self._structured_llm.invoke(prompt))
+                if cache:
+                    self.llm_cache.put(key, output)
+            return self._parse_query_output(output)
         except Exception as e:
             print(f"Error in write_query: {e}")
+            return self._fallback_query()
+
+    async def awrite_query(self, state: State, cache: bool = True) -> Dict[str, Any]:
+        try:
+            prompt = self._query_prompt(state)
+            key = cache_key(self.model_name, prompt.to_string(), self._get_table_info())
+            output = self.llm_cache.get(key) if cache else None
+            if output is None:
+                output = dict(await self._structured_llm.ainvoke(prompt))
+                if cache:
+                    self.llm_cache.put(key, output)
+            return self._parse_query_output(output)
+        except Exception as e:
+            print(f"Error in awrite_query: {e}")
+            return self._fallback_query()
     
-            try:
-                table_info = self.database.get_table_info()
-
-                lines = table_info.split('\n')
-                first_table = None
-                for line in lines:
-                    if 'CREATE TABLE' in line:
-                        parts = line.split()
-                        if len(parts) > 2:
-                            first_table = parts[2].strip('`"[]')
-                            break
-                
-                if first_table:
-                    fallback_query = f"SELECT * FROM {first_table} LIMIT 5;"
-                else:
-                    fallback_query = "SELECT name FROM sqlite_master WHERE type='table';"
-                    
-                print(f"Using fallback query: {fallback_query}")
-                return {"query": fallback_query}
-            except:
-                return {"query": "SELECT name FROM sqlite_master WHERE type='table';"}
-    
-    def execute_query(self, state: State):
+    def write_queries(self, states: list[State], cache: bool = True) -> list[Dict[str, Any]]:
+        """Generate the queries for several questions with a single structured LLM call."""
+        numbered = "\n".join(f"{i}. {state['question']}" for i, state in enumerate(states))
         try:
-            execute_query_tool = QuerySQLDatabaseTool(db=self.database)
-            raw_result = execute_query_tool.invoke(state["query"])
-            
-            if not raw_result:
-                return {"result": pd.DataFrame()}
-            
+            prompt = self._prompt_for_question(
+                "Answer each of these numbered questions with its own query, "
+                f"and give each query the number of its question as index:\n{numbered}"
+            )
+            key = cache_key(self.model_name, prompt.to_string(), self._get_table_info())
+            output = self.llm_cache.get(key) if cache else None
+            if output is None:
+                output = [dict(item) for item in self._batch_structured_llm.invoke(prompt)["queries"]]
+                if cache:
+                    self.llm_cache.put(key, output)
+            by_index = {int(item["index"]): item for item in output}
+        except Exception as e:
+            print(f"Error in write_queries: {e}")
+            by_index = {}
+        # Questions the batch answer left out are asked on their own.
+        return [
+            self._parse_query_output(by_index[i]) if i in by_index else self.write_query(state, cache=cache)
+            for i, state in enumerate(states)
+        ]
+
+    def execute_query(self, state: State, as_arrow: bool = False):
+        try:
+            # Fetch typed rows straight from the engine instead of parsing the tool's repr() string.
+            # exec_driver_sql skips text() compilation, which would also misread ":name" in literals as bind params.
+            with self.database._engine.connect() as conn:
+                result = conn.exec_driver_sql(state["query"])
+                if not result.returns_rows:
+                    return {"result": pd.DataFrame()}
+                columns = _unique_columns(list(result.keys()))
+                rows = result.fetchall()
             try:
-                result_list = ast.literal_eval(raw_result)
-            except Exception:
-                result_list = [raw_result]
-                    
-            if result_list and (isinstance(result_list[0], (tuple, list)) or isinstance(result_list[0], dict)):
-                result_df = pd.DataFrame(result_list)
-            else:
-                result_df = pd.DataFrame(result_list, columns=["value"])
-            return {"result": result_df}
+                table = _rows_to_table(rows, columns)
+            except pa.ArrowException as e:
+                # SQLite columns can mix types, which Arrow arrays cannot hold.
+                print(f"Falling back to DataFrame in execute_query: {e}")
+                return {"result": pd.DataFrame(rows, columns=columns)}
+            if as_arrow:
+                return {"result": table}
+            # Converting typed Arrow columns is faster than pandas inferring them from row tuples,
+            # and self_destruct frees each column as soon as it is converted.
+            return {"result": table.to_pandas(self_destruct=True)}
+        except SQLAlchemyError as e:
+            print(f"SQL error in execute_query: {e}")
+            return {"result": pd.DataFrame({"value": [f"Error: {e.__cause__ or e}"]})}
         except Exception as e:
             print(f"Error in execute_query: {e}")
             return {"result": pd.DataFrame()}
+
+    async def _aexecute_query(self, state: State, as_arrow: bool = False):
+        # sqlite3 releases the GIL while a statement runs, so queries from concurrent requests overlap.
+        return await asyncio.get_running_loop().run_in_executor(_SQL_POOL, self.execute_query, state, as_arrow)
      
-    def generate_answer(self, state: State):
-        try:
-            prompt = (
+    def _answer_prompt(self, state: State) -> str:
+        return (
     "You are a data analyst AI. Given the following user question, SQL query, "
     "and SQL result, provide a concise, insightful analysis in Markdown.\n\n"
     "Your answer should include:\n"
@@ -134,84 +411,336 @@ class SQLAssistApp:
     "- A short actionable takeaway or recommendation if relevant\n\n"
     f"Question: {state['question']}\n"
     f"SQL Query: {state['query']}\n"
-    f"SQL Result: {state['result']}"
+    f"SQL Result:\n{_result_for_prompt(state['result'])}"
 )
 
-            response = self.llm.invoke(prompt)
-            return {"answer": response.content}
+    def _fallback_answer(self, state: State) -> Dict[str, str]:
+        return {"answer": f"Query executed successfully. Found {len(state.get('result', pd.DataFrame()))} results."}
+
+    def generate_answer(self, state: State, cache: bool = True):
+        try:
+            prompt = self._answer_prompt(state)
+            key = cache_key(self.model_name, prompt)
+            answer = self.llm_cache.get(key) if cache else None
+            if answer is None:
+                answer = self.llm.invoke(prompt).content
+                if cache:
+                    self.llm_cache.put(key, answer)
+            return {"answer": answer}
         except Exception as e:
             print(f"Error in generate_answer: {e}")
-            return {"answer": f"Query executed successfully. Found {len(state.get('result', pd.DataFrame()))} results."}
+            return self._fallback_answer(state)
+
+    def generate_answers(self, states: list[State], cache: bool = True) -> list[Dict[str, str]]:
+        """generate_answer for several states, sending the uncached prompts as one concurrent batch."""
+        prompts = [self._answer_prompt(state) for state in states]
+        keys = [cache_key(self.model_name, prompt) for prompt in prompts]
+        answers = [self.llm_cache.get(key) if cache else None for key in keys]
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if missing:
+            responses = self.llm.batch([prompts[i] for i in missing], return_exceptions=True)
+            for i, response in zip(missing, responses):
+                if isinstance(response, Exception):
+                    print(f"Error in generate_answers: {response}")
+                    continue
+                answers[i] = response.content
+                if cache:
+                    self.llm_cache.put(keys[i], answers[i])
+        return [
+            {"answer": answer} if answer is not None else self._fallback_answer(state)
+            for state, answer in zip(states, answers)
+        ]
+
+    async def agenerate_answer(self, state: State, cache: bool = True):
+        try:
+            prompt = self._answer_prompt(state)
+            key = cache_key(self.model_name, prompt)
+            answer = self.llm_cache.get(key) if cache else None
+            if answer is None:
+                answer = (await self.llm.ainvoke(prompt)).content
+                if cache:
+                    self.llm_cache.put(key, answer)
+            return {"answer": answer}
+        except Exception as e:
+            print(f"Error in agenerate_answer: {e}")
+            return self._fallback_answer(state)
     
-    def validate_result(self, state: State):
+    def _equivalence_prompt(self, question: str, sql_query: str) -> str:
+        return (
+            f"{EQUIVALENCE_INSTRUCTIONS}\n"
+            f"Question: {question}\n"
+            f"SQL Query: {sql_query}"
+        )
+
+    def _llm_validates(self, question: str, sql_query: str) -> bool:
+        prompt = self._equivalence_prompt(question, sql_query)
+        key = cache_key(self.model_name, prompt)
         try:
-            validation_prompt = f"""
-You are an SQL validation assistant.
-
-A user asked a natural language question and a SQL query was generated.
-Your task is to check if the SQL query can reasonably answer the user's question. 
-
-User question: "{state['question']}"
-Generated SQL query: "{state['query']}"
-
-Please answer in plain English:
-- If the query is correct or mostly correct, say: "yes"
-- If the query is incorrect, clearly irrelevant, or meaningless, say: "no"
-- Consider that partial correctness is acceptable if the query returns relevant information
-
-Do not generate SQL or execute anything, just validate the query.
-"""
-            is_valid = False
-            validation_result = self.llm.invoke(validation_prompt)
-            if "yes" in validation_result.content.lower():
-                is_valid = True
-                
-            if not is_valid:
-                state["query"] = None
-                state["result"] = pd.DataFrame()
-                state["answer"] = f"The SQL query could not be validated for your question. Please ask a clearer question.\n"
+            verdict = self.llm_cache.get(key)
+            if verdict is None:
+                verdict = self.llm.invoke(prompt).content
+                self.llm_cache.put(key, verdict)
+            return verdict.strip().lower().startswith("yes")
         except Exception as e:
-            print(f"Error in validate_result: {e}")
-            pass
-        
+            print(f"Error in _llm_validates: {e}")
+            return False
+
+    async def _allm_validates(self, question: str, sql_query: str) -> bool:
+        prompt = self._equivalence_prompt(question, sql_query)
+        key = cache_key(self.model_name, prompt)
+        try:
+            verdict = self.llm_cache.get(key)
+            if verdict is None:
+                verdict = (await self.llm.ainvoke(prompt)).content
+                self.llm_cache.put(key, verdict)
+            return verdict.strip().lower().startswith("yes")
+        except Exception as e:
+            print(f"Error in _allm_validates: {e}")
+            return False
+
+    def _embed_question(self, question: str):
+        try:
+            return self.semantic_cache.embed(question)
+        except Exception as e:
+            print(f"Error embedding question for semantic cache: {e}")
+            return None
+
+    def _semantic_match(self, vector) -> tuple[float, Dict[str, str]] | None:
+        if vector is None:
+            return None
+        match = self.semantic_cache.lookup(self._get_schema_hash(), vector)
+        if match is None or match[0] < VERIFY_THRESHOLD:
+            return None
+        print(f"Semantic cache match (similarity: {match[0]:.3f}): {match[1]['sql_query']}")
+        return match
+
+    def _remember(self, state: State, vector) -> None:
+        # Fallback queries and answers are not worth reusing for other phrasings.
+        if vector is None or state["confidence"] is None or state["answer"] == self._fallback_answer(state)["answer"]:
+            return
+        self.semantic_cache.add(self._get_schema_hash(), state["question"], vector, state["query"], state["answer"])
+
+    def _reuse_cached(self, state: State, entry: Dict[str, str]) -> QueryResult:
+        # The cached SQL has been rerun so the rows reflect this session's data; only the LLM calls are skipped.
+        if state["result"] is None or len(state["result"]) == 0:
+            state["answer"] = "No rows returned for your question."
+        else:
+            state["answer"] = _direct_answer(state) or entry["answer"]
+        return self._to_query_result(state)
+
+    def _check_query(self, query: str) -> bool | None:
+        """Judge a query without the LLM: False if it cannot run here, True if it looks sound, None if unsure."""
+        import sqlglot
+        from sqlglot import exp
+
+        try:
+            statements = sqlglot.parse(query, read="sqlite")
+        except sqlglot.errors.ParseError:
+            return False
+        if not statements or not all(isinstance(statement, exp.Query) for statement in statements):
+            return None
+        known = {name.lower() for name in self.database.get_usable_table_names()}
+        for statement in statements:
+            ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+            for table in statement.find_all(exp.Table):
+                if table.name.lower() not in known and table.name.lower() not in ctes:
+                    return False
+        return True
+
+    def _local_verdict(self, state: State) -> bool | None:
+        confidence = state.get("confidence")
+        if confidence is None:
+            # Fallback queries are built from the schema itself.
+            return True
+        if confidence < MIN_QUERY_CONFIDENCE:
+            return False
+        verdict = self._check_query(state["query"])
+        if verdict is False:
+            return False
+        if verdict and confidence >= CONFIDENT_QUERY:
+            return True
+        return None
+
+    def _reject(self, state: State) -> None:
+        state["query"] = None
+        state["result"] = pd.DataFrame()
+        state["answer"] = f"The SQL query could not be validated for your question. Please ask a clearer question.\n"
+
+    def validate_result(self, state: State):
+        # Most queries are settled by the model's own confidence and a parse of the SQL;
+        # only the uncertain ones cost an extra LLM round trip.
+        verdict = self._local_verdict(state)
+        if verdict is None:
+            verdict = self._llm_validates(state["question"], state["query"])
+        if not verdict:
+            self._reject(state)
         return state
+
+    async def avalidate_result(self, state: State):
+        verdict = self._local_verdict(state)
+        if verdict is None:
+            verdict = await self._allm_validates(state["question"], state["query"])
+        if not verdict:
+            self._reject(state)
+        return state
+    
+    def _to_query_result(self, state: State) -> QueryResult:
+        return QueryResult(
+            question=state["question"],
+            sql_query=state["query"],
+            result=state["result"] if state["result"] is not None else pd.DataFrame(),
+            answer=str(state["answer"]) if state["answer"] is not None else "",
+            row_count=len(state["result"]) if state["result"] is not None else 0
+        )
     
-    def query_structured(self, user_prompt: str) -> QueryResult:
-        """Main method that returns a QueryResult object"""
-        state: State = {
+    def _new_state(self, user_prompt: str) -> State:
+        return {
             "question": user_prompt,
             "query": None,
+            "confidence": None,
             "result": None,
             "answer": None,
             "row_count": None
         }
+
+    def _error_result(self, user_prompt: str, error: Exception) -> QueryResult:
+        return QueryResult(
+            question=user_prompt,
+            sql_query="",
+            result=pd.DataFrame(),
+            answer=f"Error processing query: {str(error)}",
+            row_count=0
+        )
+    
+    def query_structured(self, user_prompt: str, as_arrow: bool = False, cache: bool = True) -> QueryResult:
+        """Main method that returns a QueryResult object.
+
+        With as_arrow=True the result is a pyarrow Table when the rows allow it,
+        for callers that serialize straight to Arrow. cache=False bypasses the LLM response cache
+        and the semantic cache of earlier, similarly phrased questions.
+        """
+        state = self._new_state(user_prompt)
         
         try:
-            query_result = self.write_query(state)
+            vector = self._embed_question(user_prompt) if cache else None
+            match = self._semantic_match(vector)
+            if match is not None:
+                similarity, entry = match
+                if similarity >= REUSE_THRESHOLD or self._llm_validates(user_prompt, entry["sql_query"]):
+                    state["query"] = entry["sql_query"]
+                    state["result"] = self.execute_query(state, as_arrow=as_arrow)["result"]
+                    return self._reuse_cached(state, entry)
+
+            query_result = self.write_query(state, cache=cache)
             state["query"] = query_result["query"]
+            state["confidence"] = query_result["confidence"]
             
-            exec_result = self.execute_query(state)
+            state = self.validate_result(state)
+            if state["query"] is None:
+                return self._to_query_result(state)
+            
+            exec_result = self.execute_query(state, as_arrow=as_arrow)
             state["result"] = exec_result["result"]
+            if state["result"] is None or len(state["result"]) == 0:
+                state["answer"] = "No rows returned for your question."
+                return self._to_query_result(state)
 
-            answer_result = self.generate_answer(state)
-            state["answer"] = answer_result["answer"]
- 
-            state = self.validate_result(state)
+            state["answer"] = _direct_answer(state)
+            if state["answer"] is None:
+                answer_result = self.generate_answer(state, cache=cache)
+                state["answer"] = answer_result["answer"]
+            self._remember(state, vector)
       
-            return QueryResult(
-                question=state["question"],
-                sql_query=state["query"],
-                result=state["result"] if state["result"] is not None else pd.DataFrame(),
-                answer=str(state["answer"]) if state["answer"] is not None else "",
-                row_count=len(state["result"]) if state["result"] is not None else 0
-            )
+            return self._to_query_result(state)
             
         except Exception as e:
             print(f"Error in query_structured: {e}")
-            return QueryResult(
-                question=user_prompt,
-                sql_query="",
-                result=pd.DataFrame(),
-                answer=f"Error processing query: {str(e)}",
-                row_count=0
-            )
\ No newline at end of file
+            return self._error_result(user_prompt, e)
+
+    def query_structured_batch(self, user_prompts: list[str], as_arrow: bool = False, cache: bool = True) -> list[QueryResult]:
+        """query_structured for several questions, with one LLM call to write every query.
+
+        The queries run in parallel threads and the answers are requested as one concurrent batch.
+        The semantic cache is not consulted.
+        """
+        states = [self._new_state(user_prompt) for user_prompt in user_prompts]
+        if not states:
+            return []
+
+        try:
+            for state, query_result in zip(states, self.write_queries(states, cache=cache)):
+                state["query"] = query_result["query"]
+                state["confidence"] = query_result["confidence"]
+                self.validate_result(state)
+
+            runnable = [state for state in states if state["query"] is not None]
+            exec_results = list(_SQL_POOL.map(lambda state: self.execute_query(state, as_arrow), runnable))
+
+            to_answer = []
+            for state, exec_result in zip(runnable, exec_results):
+                state["result"] = exec_result["result"]
+                if state["result"] is None or len(state["result"]) == 0:
+                    state["answer"] = "No rows returned for your question."
+                else:
+                    state["answer"] = _direct_answer(state)
+                    if state["answer"] is None:
+                        to_answer.append(state)
+
+            for state, answer_result in zip(to_answer, self.generate_answers(to_answer, cache=cache)):
+                state["answer"] = answer_result["answer"]
+
+            return [self._to_query_result(state) for state in states]
+
+        except Exception as e:
+            print(f"Error in query_structured_batch: {e}")
+            return [self._error_result(user_prompt, e) for user_prompt in user_prompts]
+
+    async def aquery_structured(self, user_prompt: str, as_arrow: bool = False, cache: bool = True) -> QueryResult:
+        """Async query_structured: LLM calls use ainvoke and the SQL runs on a dedicated thread pool."""
+        state = self._new_state(user_prompt)
+        
+        try:
+            vector = await asyncio.to_thread(self._embed_question, user_prompt) if cache else None
+            match = self._semantic_match(vector)
+            if match is not None:
+                similarity, entry = match
+                state["query"] = entry["sql_query"]
+                execution = self._aexecute_query(state, as_arrow)
+                if similarity >= REUSE_THRESHOLD:
+                    exec_result, valid = await execution, True
+                else:
+                    # The equivalence check only needs the SQL, so run the query while the model answers
+                    # and drop the rows if it says no.
+                    exec_result, valid = await asyncio.gather(
+                        execution, self._allm_validates(user_prompt, entry["sql_query"])
+                    )
+                if valid:
+                    state["result"] = exec_result["result"]
+                    return self._reuse_cached(state, entry)
+                state["query"] = None
+
+            query_result = await self.awrite_query(state, cache=cache)
+            state["query"] = query_result["query"]
+            state["confidence"] = query_result["confidence"]
+            
+            state = await self.avalidate_result(state)
+            if state["query"] is None:
+                return self._to_query_result(state)
+            
+            exec_result = await self._aexecute_query(state, as_arrow)
+            state["result"] = exec_result["result"]
+            if state["result"] is None or len(state["result"]) == 0:
+                state["answer"] = "No rows returned for your question."
+                return self._to_query_result(state)
+
+            state["answer"] = _direct_answer(state)
+            if state["answer"] is None:
+                answer_result = await self.agenerate_answer(state, cache=cache)
+                state["answer"] = answer_result["answer"]
+            self._remember(state, vector)
+      
+            return self._to_query_result(state)
+            
+        except Exception as e:
+            print(f"Error in aquery_structured: {e}")
+            return self._error_result(user_prompt, e)
@@ -1,10 +1,14 @@
-from sqlalchemy import create_engine
+from database import engine_for, register_memory_database
+import io
 import sqlite3
 import os
+import re
 import uuid
 import tempfile
+import pandas as pd
 
 ALLOWED_EXTENSIONS = {'sqlite', 'sql', 'db', 'csv'}
+CSV_CHUNK_SIZE = 10_000
 
 
 class Upload:
@@ -15,19 +19,58 @@ class Upload:
     def allowed_file(self):
         return '.' in self.filename and \
                self.filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-               
-    def to_engine(self):
+
+    def is_csv(self):
+        return self.filename.rsplit('.', 1)[1].lower() == 'csv'
+
+    def table_name(self):
+        # CSV uploads become one table named after the file.
+        stem = re.sub(r'\W+', '_', os.path.basename(self.filename).rsplit('.', 1)[0]).strip('_')
+        return stem or 'data'
+
+    def _load_csv(self, conn, data: bytes):
+        df = pd.read_csv(io.BytesIO(data))
+        df.to_sql(self.table_name(), conn, index=False, chunksize=CSV_CHUNK_SIZE)
+        conn.commit()
+
+    def to_engine_url(self, in_memory: bool = False):
+        """Store the upload and return the URL of a database holding it.
+
+        With in_memory=True the database only exists in this process, so it must only
+        be used when every request for the session is served by the same worker.
+        """
         if not self.allowed_file():
             raise ValueError("Invalid file type")
+        if in_memory:
+            return self._to_memory_url()
         temp_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}.db")
-        self.file_storage.save(temp_path)
-        disk_conn = sqlite3.connect(temp_path)
-        disk_conn.close()
-        engine = create_engine(f"sqlite:///{temp_path}")
-        return engine
-
+        if self.is_csv():
+            disk_conn = sqlite3.connect(temp_path)
+            try:
+                self._load_csv(disk_conn, self.file_storage.read())
+            finally:
+                disk_conn.close()
+        else:
+            self.file_storage.save(temp_path)
+        return f"sqlite:///{temp_path}"
 
-    
-   
-        
+    def _to_memory_url(self):
+        data = self.file_storage.read()
+        mem_conn = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            if self.is_csv():
+                self._load_csv(mem_conn, data)
+            else:
+                # Loads the file image straight into the connection; no temp file or backup copy.
+                mem_conn.deserialize(data)
+                mem_conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        except sqlite3.DatabaseError as e:
+            mem_conn.close()
+            raise ValueError(f"Not a valid SQLite database: {e}")
+        except Exception:
+            mem_conn.close()
+            raise
+        return register_memory_database(mem_conn)
 
+    def to_engine(self, in_memory: bool = False):
+        return engine_for(self.to_engine_url(in_memory))
@@ -21,11 +21,16 @@ def display_results(result):
     print(result['answer'])
     
 
+DISPLAY_MAX_ROWS = 50
+
 def display_table(df: pd.DataFrame) -> None:
     if df.empty:
         print("No results returned")
         return
-    print(df.to_string(index=False, max_cols=10, max_colwidth=30))
+    # to_string formats every row it is given, so cut the frame down first.
+    print(df.head(DISPLAY_MAX_ROWS).to_string(index=False, max_cols=10, max_colwidth=30))
+    if len(df) > DISPLAY_MAX_ROWS:
+        print(f"... (truncated, {len(df)} total rows)")
 
 
 chinook_test_questions = [